@@ -21,7 +21,7 @@ def filterSources(sources, md, bright, flags=0x80):
         sources = sources.getSources()
     calib = afwImage.Calib(md)
     wcs = afwImage.makeWcs(md)
-    offsets = numpy.ndarray(len(sources))
+    offsets = numpy.empty(len(sources), dtype=numpy.float64)
     outSources = afwDet.SourceSet()
     for i, src in enumerate(sources):
         try:
@@ -55,6 +55,23 @@ def filterSources(sources, md, bright, flags=0x80):
 #    print offsets.mean(), offsets.std()
     return outSources
 
+def magnitudes(comp, names):
+    """Return the average and difference of magnitudes for pairs of matched flux columns
+
+    All fluxes are converted to magnitudes with a single logarithm over one
+    block, rather than a separate pass for each column.
+
+    @param comp Comparisons of matched sources
+    @param names Names of fluxes to compare (e.g., 'psf'), using columns name+'1' and name+'2'
+    @return Arrays of average and difference magnitudes, with a row for each name
+    """
+    mags = numpy.array([(comp[name + '1'], comp[name + '2']) for name in names])
+    numpy.log10(mags, mags)
+    mags *= -2.5
+    avg = mags.mean(axis=1)
+    diff = numpy.subtract(mags[:, 0], mags[:, 1])
+    return avg, diff
+
 def run(outName, rerun, frame1, frame2, config, matchTol=1.0, bright=None, ccd=None):
     io = pipReadWrite.ReadWrite(hscSim.HscSimMapper(rerun=rerun),
                                 ['visit'], fileKeys=['visit', 'ccd'], config=config)
@@ -99,12 +116,9 @@ def run(outName, rerun, frame1, frame2, config, matchTol=1.0, bright=None, ccd=N
         modelAvg = (comp['model1'] + comp['model2']) / 2.0
         modelDiff = comp['model1'] - comp['model2']
     else:
-        psfAvg = (-2.5*numpy.log10(comp['psf1']) -2.5*numpy.log10(comp['psf2'])) / 2.0
-        psfDiff = -2.5*numpy.log10(comp['psf1']) + 2.5*numpy.log10(comp['psf2'])
-        apAvg = (-2.5*numpy.log10(comp['ap1']) - 2.5*numpy.log10(comp['ap2'])) / 2.0
-        apDiff = (-2.5*numpy.log10(comp['ap1']) + 2.5*numpy.log10(comp['ap2']))
-        modelAvg = (-2.5*numpy.log10(comp['model1']) - 2.5*numpy.log10(comp['model2'])) / 2.0
-        modelDiff = (-2.5*numpy.log10(comp['model1']) + 2.5*numpy.log10(comp['model2']))
+        avg, diff = magnitudes(comp, ('psf', 'ap', 'model'))
+        psfAvg, apAvg, modelAvg = avg
+        psfDiff, apDiff, modelDiff = diff
 
 
     plot = plotter.Plotter(outName)
@@ -1,16 +1,16 @@
 #!/usr/bin/env python
 
 import numpy
-import numpy.ma as ma
 
 import lsst.afw.detection as afwDet
 
 def magnitude(value):
-    try:
-        value = -2.5 * math.log10(value)
-    except OverflowError:
-        value = float('NAN')
-    return value
+    """Return the magnitude corresponding to a flux (scalar or array), with NAN for non-positive fluxes"""
+    value = numpy.asarray(value, dtype=numpy.float64)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        mag = -2.5 * numpy.log10(value)
+    mag = numpy.where(numpy.isfinite(mag), mag, numpy.nan)
+    return mag if mag.ndim else float(mag)
 
 class Comparisons(object):
     def __init__(self, sources1, sources2, matchTol=1.0):
@@ -19,6 +19,13 @@ class Comparisons(object):
         matches = afwDet.matchRaDec(sources1, sources2, matchTol)
         self.num = len(matches)
 
+        # All columns live in a single structured array, so a row is a single record
+        intKeys = ('flags1', 'flags2', 'index')
+        dtype = numpy.dtype([(k, numpy.int64 if k in intKeys else numpy.float64) for k in self.keys])
+        self._data = numpy.empty(self.num, dtype=dtype)
+
+        firsts = [m.first for m in matches]
+        seconds = [m.second for m in matches]
 
         # Set up arrays
         for name, method in (('ra', 'getRa'),
@@ -30,36 +37,34 @@ class Comparisons(object):
                              ('ap', 'getApFlux'),
                              ('flags', 'getFlagForDetection'),
                              ):
-            name1 = name + '1'
-            name2 = name + '2'
-            array1 = numpy.ndarray(self.num)
-            array2 = numpy.ndarray(self.num)
-            for i, m in enumerate(matches):
-                first = m.first
-                second = m.second
-                array1[i] = getattr(first, method)()
-                array2[i] = getattr(second, method)()
-            setattr(self, name1, array1)
-            setattr(self, name2, array2)
+            for key, sources in ((name + '1', firsts), (name + '2', seconds)):
+                self._data[key] = numpy.fromiter((getattr(s, method)() for s in sources),
+                                                 dtype=dtype[key], count=self.num)
 
         # convert RA,Dec to degrees for human consumption
-        self.ra  = np.degrees(self.ra)
-        self.dec = np.degrees(self.dec)
+        for key in ('ra1', 'ra2', 'dec1', 'dec2'):
+            column = self._data[key]
+            numpy.degrees(column, column)
+
+        self._data['distance'] = numpy.fromiter((m.distance for m in matches), dtype=numpy.float64,
+                                                count=self.num)
+        self._data['index'] = numpy.arange(self.num)
 
-        self.distance = numpy.array([m.distance for m in matches])
-        self.index = ma.MaskedArray(numpy.arange(self.num))
+        # Columns are also available as attributes; these are views, not copies
+        for key in self.keys:
+            setattr(self, key, self._data[key])
 
     def __getitem__(self, key):
         if isinstance(key, basestring) and key in self.keys:
-            return getattr(self, key)
-        elif isinstance(key, int):
-            values = dict()
-            for k in self.keys:
-                value = self[k]
-                values[k] = value[key]
-            return values
+            return self._data[key]
+        elif isinstance(key, (int, long, numpy.integer)):
+            return self._data[key]
         else:
             raise KeyError("Unrecognised key: %s" % key)
 
+    def rows(self, indices):
+        """Return the matches for the provided indices (or boolean selection) as a structured array"""
+        return self._data[indices]
+
     def __setitem__(self, key, value):
         raise NotImplementedError("Not yet mutable.")
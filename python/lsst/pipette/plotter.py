@@ -1,15 +1,16 @@
 #!/usr/bin/env python
 
 import math
+import threading
+import Queue
 import matplotlib
 matplotlib.use('pdf')
 import matplotlib.backends.backend_pdf
+import matplotlib.figure
 import matplotlib.pyplot as plot
 import numpy
 import numpy.ma as ma
 
-import lsst.afw.math as afwMath
-
 def gaussian(param, x):
     norm = param[0]
     offset = param[1]
@@ -19,100 +20,168 @@ def gaussian(param, x):
 class FakePdf(object):
     def close(self):
         plot.show()
-    def savefig(self):
-        plot.close()
+    def savefig(self, figure):
+        pass
 
 class Plotter(object):
-    def __init__(self, name=None):        
+    def __init__(self, name=None, queueSize=4):
+        """Initialisation
+
+        @param name Name of PDF file for output, or None to use a FakePdf
+        @param queueSize Maximum number of figures waiting to be written to the PDF file
+        """
         self.name = name
+        self._queue = None
+        self._error = None
+        # Figures are recycled once saved; enough for the queue, the writer and the plot being drawn
+        self._figures = Queue.Queue()
+        self._numFigures = 0
+        self._maxFigures = queueSize + 2
         if name is None:
             self.pdf = FakePdf()
         else:
             if not self.name.endswith(".pdf"):
                 self.name += ".pdf"
             self.pdf = matplotlib.backends.backend_pdf.PdfPages(self.name)
+            # Figures are written to the PDF file in a separate thread, so that plotting can proceed
+            self._queue = Queue.Queue(maxsize=queueSize)
+            self._thread = threading.Thread(target=self._write)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _write(self):
+        """Write queued figures to the PDF file, until receiving None"""
+        while True:
+            figure = self._queue.get()
+            if figure is None:
+                return
+            try:
+                if self._error is None:
+                    self.pdf.savefig(figure)
+            except Exception, e:
+                self._error = e
+            self._figures.put(figure)
+
+    def _checkError(self):
+        """Raise any error encountered while writing figures"""
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
+
+    def _figure(self):
+        """Return a blank figure
+
+        Figures are created directly rather than through pyplot, so they do not
+        touch pyplot's global state and may be saved from another thread.  A
+        figure that has been saved is cleared and reused in preference to
+        setting up a new one; if all figures are in use and the limit has been
+        reached, we wait for one to be saved.
+        """
+        if self._figures.empty() and self._numFigures < self._maxFigures:
+            figure = matplotlib.figure.Figure()
+            matplotlib.backends.backend_pdf.FigureCanvasPdf(figure)
+            self._numFigures += 1
+            return figure
+        figure = self._figures.get()
+        figure.clear()
+        return figure
+
+    def _save(self, figure):
+        """Save a figure"""
+        if self._queue is None:
+            self.pdf.savefig(figure)
+            self._figures.put(figure)
+            return
+        self._checkError()
+        self._queue.put(figure)
 
     def close(self):
+        if self._queue is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._queue = None
+            self._checkError()
         self.pdf.close()
 
     def xy(self, x, y, axis=None, title=None):
-        plot.figure()
-        plot.scatter(x, y, marker='x')
+        figure = self._figure()
+        axes = figure.add_subplot(1, 1, 1)
+        axes.scatter(x, y, marker='x')
         if axis is not None:
-            plot.axis(axis)
+            axes.axis(axis)
         if title is not None:
-            plot.title(title)
-        self.pdf.savefig()
-        plot.close()
+            axes.set_title(title)
+        self._save(figure)
 
     def histogram(self, data, bounds, bins=51, gaussFit=True, iterations=3, clip=3.0, title=None):
-        plot.figure()
-        n, bins, patches = plot.hist(data, bins=bins, range=bounds, normed=False,
+        figure = self._figure()
+        axes = figure.add_subplot(1, 1, 1)
+        n, bins, patches = axes.hist(data, bins=bins, range=bounds, normed=False,
                                      histtype='bar', align='mid')
 
         if gaussFit:
-            calc = afwMath.vectorF()
-            for value in data:
-                if value > bounds[0] and value < bounds[1]:
-                    calc.push_back(value)
-            stats = afwMath.makeStatistics(calc, afwMath.MEANCLIP | afwMath.STDEVCLIP)
-            mean = stats.getValue(afwMath.MEANCLIP)
-            stdev = stats.getValue(afwMath.STDEVCLIP)
-            num = len(calc)
+            values = numpy.asarray(data, dtype=numpy.float64)
+            values = values[(values > bounds[0]) & (values < bounds[1])]
+            num = len(values)
+
+            # Clipped mean and standard deviation
+            mean, stdev = values.mean(), values.std()
+            for i in range(iterations):
+                values = values[numpy.abs(values - mean) < clip * stdev]
+                mean, stdev = values.mean(), values.std()
 
             print "Histogram statistics:", num, mean, stdev
             norm = num * (bins[1:] - bins[:-1]).mean() / math.sqrt(2.0 * math.pi) / stdev
             middle = (bins[:-1] + bins[1:]) / 2.0
             gauss = gaussian([norm, mean, stdev], middle)
-            plot.plot(middle, gauss, 'r-', label='%d*N(%.3f, %.3f^2)' % (num, mean, stdev))
-            leg = plot.legend(loc='upper right')
+            axes.plot(middle, gauss, 'r-', label='%d*N(%.3f, %.3f^2)' % (num, mean, stdev))
+            leg = axes.legend(loc='upper right')
             for t in leg.get_texts():
                 t.set_fontsize('small')
 
         if title is not None:
-            plot.title(title)
-        self.pdf.savefig()
-        plot.close()
+            axes.set_title(title)
+        self._save(figure)
 
     def xy2(self, x1, y1, x2, y2, axis1=None, axis2=None, title1=None, title2=None):
-        plot.figure()
-        plot.subplot(2, 1, 1)
+        figure = self._figure()
+        axes = figure.add_subplot(2, 1, 1)
         if axis1 is not None:
-            plot.axis(axis1)
-        plot.scatter(x1, x2, marker='+')
+            axes.axis(axis1)
+        axes.scatter(x1, x2, marker='+')
         if title1 is not None:
-            plot.title(title1)
+            axes.set_title(title1)
 
-        plot.subplot(2, 1, 2)
+        axes = figure.add_subplot(2, 1, 2)
         if axis2 is not None:
-            plot.axis(axis2)
-        plot.scatter(x2, y2, marker='+')
+            axes.axis(axis2)
+        axes.scatter(x2, y2, marker='+')
         if title2 is not None:
-            plot.title(title2)
+            axes.set_title(title2)
 
-        self.pdf.savefig()
-        plot.close()
+        self._save(figure)
 
     def quivers(self, x, y, dx, dy, title=None, addUnitQuiver=0.0):
         def placeUnitQuiver(x,y):
             return (min(x) + 0.05 * (max(x)-min(x)),
                     min(y) + 0.05 * (max(y)-min(y)))
         
-        plot.figure()
+        figure = self._figure()
+        axes = figure.add_subplot(1, 1, 1)
         if addUnitQuiver:
             qx, qy = placeUnitQuiver(x,y)
             if False:
-                plot.quiver(x, y, dx, dy)
-                plot.quiver([qx], [qy], [addUnitQuiver], [addUnitQuiver])
+                axes.quiver(x, y, dx, dy)
+                axes.quiver([qx], [qy], [addUnitQuiver], [addUnitQuiver])
             else:
                 fx = numpy.concatenate([x, [qx]])
                 fy = numpy.concatenate([y, [qy]])
                 fdx = numpy.concatenate([dx, [addUnitQuiver]])
                 fdy = numpy.concatenate([dy, [addUnitQuiver]])
-                plot.quiver(fx, fy, fdx, fdy, units='x')
+                axes.quiver(fx, fy, fdx, fdy, units='x')
         else:
-            plot.quiver(x, y, dx, dy)
+            axes.quiver(x, y, dx, dy)
         if title is not None:
-            plot.title(title)
-        self.pdf.savefig()
-        plot.close()
+            axes.set_title(title)
+        self._save(figure)